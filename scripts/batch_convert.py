@@ -1,57 +1,135 @@
 import argparse
+import shlex
 import subprocess
 import os
 import sys
+import wave
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from time import sleep
 
 from tqdm import tqdm
 
+SEP = "=" * 70
+
 
 class BatchProcessor:
 
-    def __init__(self, brrtools_dir, indir, outdir, rate):
+    def __init__(self, brrtools_dir, indir, outdir, rate, max_workers=None, force=False,
+                 dry_run=False):
         self.infiles = BatchProcessor.get_infiles(indir)
-        self.outpath = BatchProcessor.get_outpath(outdir)
+        self.outpath = BatchProcessor.get_outpath(outdir, dry_run)
         self.rate = rate
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.dry_run = dry_run
+
+        # Precompute (in_wav, tmp_brr, tmp_wav, out_wav) path strings for every file.
+        # The decoder writes to tmp_wav, which only replaces out_wav on success.
+        # Temp names keep the full file name so a.wav and a.WAV never share one.
+        jobs = []
+        for p in self.infiles:
+            out_wav = os.path.join(self.outpath, p.name)
+            jobs.append((str(p), f"{out_wav}.brr", f"{out_wav}.part", out_wav))
+
+        # Skip files whose output is newer than the input and was decoded
+        # at the same rate, unless forced
+        if not force:
+            jobs = [job for job in jobs
+                    if not BatchProcessor.is_up_to_date(job[0], job[3], self.rate)]
+        self.jobs = jobs
+        self.skipped = len(self.infiles) - len(self.jobs)
+        if self.skipped:
+            print(f"Skipping {self.skipped} files with up-to-date output (use --force to reprocess them)")
+
         self.brrtools_bin = BatchProcessor.get_brrtools_bin(brrtools_dir)
 
-        # Find Cygwin bash on Windows
+        # Resolve executables and the child environment once for all files
+        self.env = None
         if sys.platform == "win32":
-            self.cygwin_bash = self._find_cygwin_bash()
-            print(f"Using Cygwin bash: {self.cygwin_bash}")
+            self.encoder_path = str(self.brrtools_bin / "brr_encoder.exe")
+            self.decoder_path = str(self.brrtools_bin / "brr_decoder.exe")
+
+            # Cygwin executables need cygwin1.dll, which usually sits next to them
+            self.env = os.environ.copy()
+            self.env["PATH"] = str(self.brrtools_bin) + os.pathsep + self.env.get("PATH", "")
+        else:
+            # Mac/Linux - native executables
+            self.encoder_path = str(self.brrtools_bin / "brr_encoder")
+            self.decoder_path = str(self.brrtools_bin / "brr_decoder")
 
     def process_batch(self):
+        total = len(self.infiles)
+        if self.dry_run:
+            # Nothing is executed, so list the plan serially in job order
+            for job in self.jobs:
+                self.process_file(*job)
+            print(f"\n{SEP}\n"
+                  f"Dry run complete, nothing was executed.\n"
+                  f"  Planned: {len(self.jobs)}/{total}\n"
+                  f"  Skipped: {self.skipped}/{total}\n"
+                  f"{SEP}")
+            return
+
         success_count = 0
         error_count = 0
 
-        for infile in tqdm(self.infiles, desc="Processing"):
-            try:
-                self.process_file(infile)
-                success_count += 1
-            except subprocess.CalledProcessError as e:
-                error_count += 1
-                print(f"\n{'='*70}", file=sys.stderr)
-                print(f"ERROR processing {infile.name}", file=sys.stderr)
-                print(f"Exit code: {e.returncode}", file=sys.stderr)
-                if e.stdout:
-                    print(f"Stdout: {e.stdout}", file=sys.stderr)
-                if e.stderr:
-                    print(f"Stderr: {e.stderr}", file=sys.stderr)
-                print(f"{'='*70}", file=sys.stderr)
-                continue
-            except Exception as e:
-                error_count += 1
-                print(f"\nUnexpected error processing {infile.name}: {e}", file=sys.stderr)
-                import traceback
-                traceback.print_exc()
-                continue
-
-        print(f"\n{'='*70}")
-        print(f"Batch processing complete!")
-        print(f"  Success: {success_count}/{len(self.infiles)}")
-        print(f"  Errors:  {error_count}/{len(self.infiles)}")
-        print(f"{'='*70}")
+        # The heavy lifting happens in the external encoder/decoder processes,
+        # so threads are enough to keep every core busy.
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {executor.submit(self.process_file, *job): job
+                           for job in self.jobs}
+
+                try:
+                    # Throttle redraws so many fast jobs don't flood the terminal
+                    with tqdm(total=len(futures), desc="Processing",
+                              miniters=max(1, len(futures) // 200), mininterval=0.2) as bar:
+                        for future in as_completed(futures):
+                            name = os.path.basename(futures[future][0])
+                            try:
+                                future.result()
+                                success_count += 1
+                            except subprocess.CalledProcessError as e:
+                                error_count += 1
+                                print(f"\n{SEP}", file=sys.stderr)
+                                print(f"ERROR processing {name}", file=sys.stderr)
+                                print(f"Exit code: {e.returncode}", file=sys.stderr)
+                                if e.stderr:
+                                    print(f"Stderr: {e.stderr.decode(errors='replace')}", file=sys.stderr)
+                                print(SEP, file=sys.stderr)
+                            except Exception as e:
+                                error_count += 1
+                                print(f"\nUnexpected error processing {name}: {e}", file=sys.stderr)
+                                import traceback
+                                traceback.print_exc()
+                            bar.update(1)
+                except BaseException:
+                    # On Ctrl-C, drop queued jobs instead of letting the executor run them all
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise
+        finally:
+            # Runs once in-flight jobs are done, so failed or interrupted ones are cleaned up too
+            self.remove_tmp_files()
+
+        print(f"\n{SEP}\n"
+              f"Batch processing complete!\n"
+              f"  Success: {success_count}/{total}\n"
+              f"  Errors:  {error_count}/{total}\n"
+              f"  Skipped: {self.skipped}/{total}\n"
+              f"{SEP}")
+
+    @staticmethod
+    def is_up_to_date(in_wav, out_wav, rate):
+        try:
+            # Processing in place (indir == outdir) always overwrites the input
+            if os.path.samefile(in_wav, out_wav):
+                return False
+            if os.path.getmtime(out_wav) < os.path.getmtime(in_wav):
+                return False
+            # The decoder writes its -s rate into the WAV header
+            with wave.open(out_wav, "rb") as w:
+                return w.getframerate() == rate
+        except (OSError, EOFError, wave.Error):
+            return False
 
     @staticmethod
     def get_infiles(indir):
@@ -59,8 +137,11 @@ class BatchProcessor:
         if not dirpath.is_dir():
             raise ValueError(f"Input directory does not exist: {dirpath}")
 
-        infiles = [item for item in dirpath.iterdir() 
-                   if item.is_file() and item.suffix.lower() == ".wav"]
+        # DirEntry.is_file() uses cached directory info, avoiding a stat per entry
+        with os.scandir(dirpath) as it:
+            infiles = [Path(entry.path) for entry in it
+                       if entry.is_file() and entry.name.lower().endswith(".wav")]
+        infiles.sort()
 
         if not infiles:
             raise ValueError(f"No .wav files found in {dirpath}")
@@ -69,14 +150,19 @@ class BatchProcessor:
         return infiles
 
     @staticmethod
-    def get_outpath(outdir):
-        outpath = Path(outdir)
-        if not outpath.exists():
-            os.makedirs(outpath, exist_ok=True)
-            print(f"Created output directory: {outpath}")
-
-        if not outpath.is_dir():
-            raise ValueError(f"Output path exists but is not a directory: {outpath}")
+    def get_outpath(outdir, dry_run=False):
+        outpath = os.path.abspath(outdir)
+        if not os.path.isdir(outpath):
+            if dry_run:
+                if os.path.exists(outpath):
+                    raise ValueError(f"Output path exists but is not a directory: {outdir}")
+                print(f"Would create output directory: {outdir}")
+                return outpath
+            try:
+                os.makedirs(outpath)
+            except FileExistsError:
+                raise ValueError(f"Output path exists but is not a directory: {outdir}") from None
+            print(f"Created output directory: {outdir}")
 
         return outpath
 
@@ -92,153 +178,63 @@ class BatchProcessor:
 
         return brrtools_bin
 
-    @staticmethod
-    def _find_cygwin_bash():
-        """Find Cygwin bash.exe, avoiding WSL bash"""
-        # Common Cygwin installation paths
-        possible_paths = [
-            Path("C:/cygwin64/bin/bash.exe"),
-            Path("C:/cygwin/bin/bash.exe"),
-        ]
-
-        # Check environment variable
-        cygwin_root = os.environ.get("CYGWIN_ROOT")
-        if cygwin_root:
-            possible_paths.insert(0, Path(cygwin_root) / "bin" / "bash.exe")
-
-        # Check standard locations first
-        for bash_path in possible_paths:
-            if bash_path.exists():
-                return str(bash_path)
-
-        # Try to find all bash.exe locations and filter for Cygwin
-        try:
-            result = subprocess.run(
-                ["where", "bash.exe"],
-                capture_output=True,
-                text=True,
-                check=False
-            )
-            if result.returncode == 0:
-                bash_locations = result.stdout.strip().split('\n')
-                for location in bash_locations:
-                    location = location.strip()
-                    # Skip WSL bash (in System32 or system32)
-                    if "system32" in location.lower():
-                        continue
-                    # Accept Cygwin bash
-                    if "cygwin" in location.lower() and Path(location).exists():
-                        return location
-        except Exception:
-            pass
-
-        raise FileNotFoundError(
-            "Could not find Cygwin bash.exe.\n"
-            "Make sure Cygwin is installed.\n"
-            "If Cygwin is installed in a non-standard location, set CYGWIN_ROOT environment variable.\n"
-            "Example: set CYGWIN_ROOT=C:\\cygwin64"
-        )
-
-    def process_file(self, infile):
+    def process_file(self, in_wav, tmp_brr, tmp_wav, out_wav):
         """Process a single WAV file through BRR encoding and decoding.
 
-        Handles both Unix/Linux and Windows (Cygwin) environments.
+        On Windows the Cygwin-built executables are run directly, without
+        going through bash.
         """
-        # Prepare file paths
-        in_wav = str(infile)
-        tmp_brr = self.outpath / f"{infile.stem}.brr"
-        out_wav = self.outpath / infile.name
-
-        # Determine executable names based on platform
-        if sys.platform == "win32":
-            # Windows with Cygwin executables
-            brr_encoder_exe = "brr_encoder"
-            brr_decoder_exe = "brr_decoder"
-
-            # Convert Windows paths to Cygwin format
-            in_wav_path = self._windows_to_cygwin_path(in_wav)
-            tmp_brr_path = self._windows_to_cygwin_path(str(tmp_brr))
-            out_wav_path = self._windows_to_cygwin_path(str(out_wav))
-
-            # Full path to Cygwin executables
-            brr_encoder = self._windows_to_cygwin_path(str(self.brrtools_bin / brr_encoder_exe))
-            brr_decoder = self._windows_to_cygwin_path(str(self.brrtools_bin / brr_decoder_exe))
-
-            # Run through Cygwin bash (NOT WSL bash!)
-            encode_cmd = f'"{brr_encoder}" -sb{self.rate} "{in_wav_path}" "{tmp_brr_path}"'
-            decode_cmd = f'"{brr_decoder}" -s{self.rate} -g "{tmp_brr_path}" "{out_wav_path}"'
-
-            subprocess.run(
-                [self.cygwin_bash, "-c", encode_cmd],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            subprocess.run(
-                [self.cygwin_bash, "-c", decode_cmd],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-        else:
-            # Mac/Linux - native executables
-            brr_encoder = str(self.brrtools_bin / "brr_encoder")
-            brr_decoder = str(self.brrtools_bin / "brr_decoder")
-
-            subprocess.run(
-                [brr_encoder, f"-sb{self.rate}", in_wav, str(tmp_brr)],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-            subprocess.run(
-                [brr_decoder, f"-s{self.rate}", "-g", str(tmp_brr), str(out_wav)],
-                check=True,
-                capture_output=True,
-                text=True
-            )
-
-        # Delete temporary BRR file
-        if tmp_brr.exists():
-            retries = 0
-            # Add a retry loop with a short wait in case the file is temporarily locked by the OS.
-            while retries < 6:
-                try:
-                    retries += 1
-                    os.remove(tmp_brr)
-                    break
-                except Exception as e_del:
-                    if retries < 6:
-                        sleep(0.05)
-                        continue
-                    print(f"Warning: Could not remove temporary BRR file: {e_del}", file=sys.stderr)
-                    break
+        encode_cmd = [self.encoder_path, f"-sb{self.rate}", in_wav, tmp_brr]
+        decode_cmd = [self.decoder_path, f"-s{self.rate}", "-g", tmp_brr, tmp_wav]
+
+        if self.dry_run:
+            for cmd in (encode_cmd, decode_cmd):
+                # Quote the way the platform's own shell expects
+                if sys.platform == "win32":
+                    print(subprocess.list2cmdline(cmd))
+                else:
+                    print(" ".join(shlex.quote(arg) for arg in cmd))
+            return
+
+        subprocess.run(
+            encode_cmd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env=self.env
+        )
+        subprocess.run(
+            decode_cmd,
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            env=self.env
+        )
+        os.replace(tmp_wav, out_wav)
 
-    @staticmethod
-    def _windows_to_cygwin_path(win_path):
-        """Convert Windows path to Cygwin /cygdrive format.
+        # Delete temporary BRR file. If the OS still holds it locked, it is
+        # retried once the whole batch has finished.
+        try:
+            os.remove(tmp_brr)
+        except OSError:
+            pass
 
-        Examples:
-            C:\\Users\\file.wav -> /cygdrive/c/Users/file.wav
-            D:\\Music\\song.wav -> /cygdrive/d/Music/song.wav
-        """
-        path = Path(win_path).resolve()
-        parts = path.parts
-
-        # Check if path has a drive letter (e.g., C:\\)
-        if len(parts) > 0 and len(parts[0]) == 3 and parts[0][1] == ':':
-            drive = parts[0][0].lower()
-            rest = '/'.join(parts[1:])
-            return f"/cygdrive/{drive}/{rest}"
-        else:
-            # Relative or UNC path - just convert backslashes
-            return str(path).replace('\\', '/')
+    def remove_tmp_files(self):
+        """Remove any temporary BRR and partial WAV files left behind by process_file."""
+        for _, tmp_brr, tmp_wav, _ in self.jobs:
+            for tmp_file in (tmp_brr, tmp_wav):
+                try:
+                    os.remove(tmp_file)
+                except FileNotFoundError:
+                    pass
+                except OSError as e_del:
+                    print(f"Warning: Could not remove temporary file: {e_del}", file=sys.stderr)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Batch process WAV files to make them sound like SNES sounds",
-        epilog="Requires Cygwin on Windows. Set CYGWIN_ROOT if installed in non-standard location."
+        epilog="On Windows, cygwin1.dll must be in the BRRtools bin directory or on PATH."
     )
     parser.add_argument("brrtools", type=str, help="Path to BRRTools directory")
     parser.add_argument("indir", type=str, help="Path to input directory with WAV files")
@@ -247,11 +243,27 @@ if __name__ == "__main__":
         "--rate", "-r", type=int, default=16000,
         help="Sample rate in Hz for BRR compression (default: 16000)"
     )
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=os.cpu_count() or 1,
+        help="Number of files to process in parallel (default: number of CPUs)"
+    )
+    parser.add_argument(
+        "--force", "-f", action="store_true",
+        help="Reprocess files even if their output is newer than the input and "
+             "was decoded at the same --rate"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Print the encoder/decoder commands without running them"
+    )
 
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
 
     try:
-        processor = BatchProcessor(args.brrtools, args.indir, args.outdir, args.rate)
+        processor = BatchProcessor(args.brrtools, args.indir, args.outdir, args.rate,
+                                   args.jobs, args.force, args.dry_run)
         processor.process_batch()
         print("\nDONE")
     except Exception as e: